@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
+import atexit
+import os
+import re
+import shutil
 import sys
 import json
 import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
+# orjson parses ffprobe output considerably faster; its errors subclass json.JSONDecodeError
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
+try:
+    from pymediainfo import MediaInfo
+except ImportError:
+    MediaInfo = None
+
 # Default encoding settings
 DEFAULT_PRESET = {
     'name': 'Default x264',
@@ -20,9 +40,117 @@ ENCODE_SETTINGS = {
     'output_extension': '.mp4',  # New file extension
     'presets': [DEFAULT_PRESET], # Initialize with default preset
     'preset_file': 'presets.json',  # Name of the preset file
-    'merged_audio_codec': 'aac'  # Audio codec used when merging tracks
+    'merged_audio_codec': 'aac',  # Audio codec used when merging tracks
+    'keep_merged_sources': True,  # Also copy the original audio tracks when merging
+    'max_concurrent_encodes': 2,  # Number of ffmpeg encodes allowed to run at once
+    'hw_encoder_cache': '.hw_encoders.json',  # Remembers which hardware encoders work
+    'stderr_tail_lines': 200,  # Lines of ffmpeg output kept for error messages
+    'probe_cache': '.probe_cache.json',  # Stream information remembered between runs
+    'probe_workers': 4,  # Files probed in the background at once
+    'copy_batch_size': 8  # Copy-only files in a batch that share one ffmpeg process (1 = off)
+}
+
+# The ffprobe fields we read, probing only these keeps its output small
+PROBE_ENTRIES = 'stream=codec_type,codec_name:stream_tags=title,handler_name,language:format=duration'
+
+# Bump when the shape of cached probe results changes in a way PROBE_ENTRIES doesn't show,
+# e.g. a change to what _probe_native returns
+PROBE_CACHE_VERSION = 2
+
+# Probe results by resolved path, loaded from and saved to the probe cache file
+PROBE_CACHE = {
+    'file': None,
+    'entries': {},
+    'dirty': False
+}
+
+# Presets offered when the matching hardware encoder is usable
+HW_ENCODER_PRESETS = [
+    {
+        'name': 'NVENC H.264',
+        'codec': 'h264_nvenc',
+        'params': {'preset': 'p4', 'rc': 'vbr', 'cq': 23},
+        'hwaccel': 'cuda'  # Decode on the GPU too when no software filters are needed
+    },
+    {
+        'name': 'NVENC HEVC',
+        'codec': 'hevc_nvenc',
+        'params': {'preset': 'p4', 'rc': 'vbr', 'cq': 25},
+        'hwaccel': 'cuda'
+    },
+    {
+        'name': 'QSV H.264',
+        'codec': 'h264_qsv',
+        'params': {'preset': 'medium', 'global_quality': 23}
+    },
+    {
+        'name': 'VideoToolbox H.264',
+        'codec': 'h264_videotoolbox',
+        'params': {'q:v': 60}
+    }
+]
+
+# Absolute paths to the ffmpeg tools, looked up once instead of on every call
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+# Containers whose headers pymediainfo can read without spawning ffprobe.
+# MP4/MOV stay on ffprobe: MediaInfo lists chapter tracks there as Text tracks (ffprobe sees
+# data streams, so subtitle indices would shift) and doesn't expose the tracks' handler names
+NATIVE_PROBE_EXTENSIONS = {'.mkv', '.mka', '.mks', '.webm'}
+
+# Audio codecs the MP4 muxer accepts as a stream copy
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'flac', 'opus'}
+
+# Output extensions that can hold any audio codec
+MATROSKA_EXTENSIONS = {'.mkv', '.mka'}
+
+# Map MediaInfo audio formats to ffprobe codec names
+MEDIAINFO_AUDIO_CODECS = {
+    'AAC': 'aac',
+    'AC-3': 'ac3',
+    'E-AC-3': 'eac3',
+    'ALAC': 'alac',
+    'FLAC': 'flac',
+    'Opus': 'opus',
+    'Vorbis': 'vorbis',
+    'DTS': 'dts',
+    'MLP FORMAT': 'truehd',
+    'PCM': 'pcm'
+}
+
+# Map MediaInfo track types to ffprobe codec types
+MEDIAINFO_TRACK_TYPES = {
+    'Video': 'video',
+    'Audio': 'audio',
+    'Text': 'subtitle'
 }
 
+def _validate_preset(preset):
+    """
+    Check that a preset has a name, a codec and simple parameters, printing why not
+    """
+    problem = None
+    if not isinstance(preset, dict):
+        problem = "not an object"
+    elif not isinstance(preset.get('name'), str):
+        problem = "missing 'name'"
+    elif not isinstance(preset.get('codec'), str):
+        problem = "missing 'codec'"
+    elif not isinstance(preset.get('params', {}), dict):
+        problem = "'params' is not an object"
+    elif not all(isinstance(value, (str, int, float)) for value in preset.get('params', {}).values()):
+        problem = "'params' values must be strings or numbers"
+    
+    if problem:
+        name = preset.get('name', preset) if isinstance(preset, dict) else preset
+        print(f"Warning: Skipping preset {name} in {ENCODE_SETTINGS['preset_file']}: {problem}")
+        return False
+    
+    # Downstream code reads preset['params'] directly
+    preset.setdefault('params', {})
+    return True
+
 def load_encoding_presets():
     """
     Load additional encoding presets from preset file if it exists
@@ -34,113 +162,283 @@ def load_encoding_presets():
         return False
         
     try:
-        with open(preset_file, 'r') as f:
-            content = f.read().strip()
-            if not content:
-                return False
-            custom_presets = json.loads(content)
-            if isinstance(custom_presets, list):
-                ENCODE_SETTINGS['presets'].extend(custom_presets)
-                return True
+        with open(preset_file, 'rb') as f:
+            custom_presets = _json.loads(f.read())
+        if isinstance(custom_presets, list):
+            ENCODE_SETTINGS['presets'].extend(p for p in custom_presets if _validate_preset(p))
+            return True
     except json.JSONDecodeError:
         return False
     except Exception as e:
         print(f"Warning: Error loading {ENCODE_SETTINGS['preset_file']}: {e}")
     return False
 
-def get_track_info(video_file):
+@dataclass
+class EncodingPlan:
+    """
+    ffmpeg settings chosen for a file, minus anything that depends on its path
     """
-    Extract track information from video file using ffprobe
+    video_settings: list
+    audio_settings: list
+    input_settings: list
+    filter_complex_template: str = None  # Contains a {subpath} placeholder when burning subtitles
+    preset: dict = None  # None when the video stream is copied
+    subtitle_id: int = None
+
+def _encoder_works(codec):
+    """
+    Check that an encoder can actually open by encoding a few blank frames
+    """
+    cmd = [
+        FFMPEG, '-hide_banner', '-v', 'error',
+        '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+        '-c:v', codec, '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode == 0
+
+def detect_hw_encoders():
     """
+    Find which hardware encoders from HW_ENCODER_PRESETS are usable.
+    The result is cached on disk and only redone when the ffmpeg version changes
+    """
+    cache_file = Path(__file__).parent / ENCODE_SETTINGS['hw_encoder_cache']
+    
+    version = subprocess.run([FFMPEG, '-version'], capture_output=True, text=True).stdout.partition('\n')[0]
+    
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = _json.loads(f.read())
+        if cache.get('version') == version:
+            return set(cache.get('encoders', []))
+    except (OSError, ValueError):
+        pass
+    
+    result = subprocess.run([FFMPEG, '-hide_banner', '-encoders'], capture_output=True, text=True)
+    # Encoder lines look like " V....D h264_nvenc           NVIDIA NVENC H.264 encoder"
+    available = {line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 1}
+    
+    # ffmpeg builds often list hardware encoders without the hardware being present
+    encoders = {preset['codec'] for preset in HW_ENCODER_PRESETS
+                if preset['codec'] in available and _encoder_works(preset['codec'])}
+    
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump({'version': version, 'encoders': sorted(encoders)}, f)
+    except OSError as e:
+        print(f"Warning: Could not write {ENCODE_SETTINGS['hw_encoder_cache']}: {e}")
+    
+    return encoders
+
+def load_hw_encoder_presets():
+    """
+    Add presets for the hardware encoders available on this system
+    """
+    encoders = detect_hw_encoders()
+    names = {preset['name'] for preset in ENCODE_SETTINGS['presets']}
+    for preset in HW_ENCODER_PRESETS:
+        if preset['codec'] in encoders and preset['name'] not in names:
+            ENCODE_SETTINGS['presets'].append(preset)
+
+def _mediainfo_language(track):
+    """
+    Get the 3-letter language code ffprobe would show for a MediaInfo track
+    """
+    # other_language holds the name and the 2- and 3-letter codes, e.g. ['English', 'en', 'eng', ...]
+    for language in track.get('other_language') or []:
+        if len(language) == 3 and language.isalpha() and language.islower():
+            return language
+    return track.get('language')
+
+def _mediainfo_audio_codec(track):
+    """
+    Get the ffprobe codec name for a MediaInfo audio track
+    """
+    audio_format = track.get('format')
+    if audio_format == 'MPEG Audio':
+        return 'mp3' if track.get('format_profile') == 'Layer 3' else 'mp2'
+    return MEDIAINFO_AUDIO_CODECS.get(audio_format, (audio_format or '').lower() or None)
+
+def _probe_native(resolved_path):
+    """
+    Read stream information straight from the container header with pymediainfo.
+    Returns a dict shaped like ffprobe's JSON output, or None if unsupported
+    """
+    if MediaInfo is None or Path(resolved_path).suffix.lower() not in NATIVE_PROBE_EXTENSIONS:
+        return None
+    
+    try:
+        data = MediaInfo.parse(resolved_path).to_data()
+    except Exception:
+        return None
+    
+    info = {'streams': [], 'format': {}}
+    for track in data.get('tracks', []):
+        track_type = track.get('track_type')
+        if track_type == 'General':
+            if track.get('duration') is not None:
+                # MediaInfo reports milliseconds, ffprobe reports seconds
+                info['format']['duration'] = str(float(track['duration']) / 1000)
+            continue
+        
+        codec_type = MEDIAINFO_TRACK_TYPES.get(track_type)
+        if codec_type is None:
+            continue
+        
+        # Closed captions inside the video stream get IDs like "1-CC1", ffmpeg doesn't list them as streams
+        if not str(track.get('track_id', '')).isdigit():
+            continue
+        
+        tags = {}
+        if track.get('title'):
+            tags['title'] = track['title']
+        language = _mediainfo_language(track)
+        if language:
+            tags['language'] = language
+        stream = {'codec_type': codec_type, 'tags': tags}
+        if codec_type == 'audio':
+            stream['codec_name'] = _mediainfo_audio_codec(track)
+        info['streams'].append(stream)
+    
+    # Containers MediaInfo could not make sense of go through ffprobe instead
+    if not info['streams']:
+        return None
+    return info
+
+@lru_cache(maxsize=None)
+def _probe_file(resolved_path, mtime_ns):
+    """
+    Probe a file, cached per (path, mtime) so each file is probed only once
+    """
+    info = _probe_native(resolved_path)
+    if info is not None:
+        return info
+    
     try:
         # Run ffprobe command to get stream information in JSON format
         cmd = [
-            'ffprobe',
+            FFPROBE,
             '-v', 'quiet',
             '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            str(video_file)
+            # Only ask for the fields we actually use
+            '-show_entries', PROBE_ENTRIES,
+            resolved_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # Keep stdout as bytes, the JSON parser decodes it itself
+        result = subprocess.run(cmd, capture_output=True)
         
         if result.returncode != 0:
-            print(f"Error processing {video_file}: {result.stderr}")
+            print(f"Error processing {resolved_path}: {result.stderr.decode(errors='replace')}")
             return None
             
-        return json.loads(result.stdout)
+        return _json.loads(result.stdout)
         
-    except FileNotFoundError:
-        print("Error: ffprobe not found. Please ensure ffmpeg is installed and in your PATH")
-        return None
     except Exception as e:
-        print(f"Error processing {video_file}: {str(e)}")
+        print(f"Error processing {resolved_path}: {str(e)}")
         return None
 
-def get_audio_tracks(video_file):
+def load_probe_cache():
     """
-    Get list of audio tracks and their titles
+    Load probe results saved by previous runs
     """
-    info = get_track_info(video_file)
-    if not info or 'streams' not in info:
-        return []
+    # Resolved now, __file__ is gone from __main__ by the time atexit handlers run
+    cache_file = Path(__file__).parent / ENCODE_SETTINGS['probe_cache']
+    PROBE_CACHE['file'] = cache_file
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = _json.loads(f.read())
+    except (OSError, ValueError):
+        return
     
-    audio_tracks = []
-    for stream in info['streams']:
-        if stream.get('codec_type') == 'audio':
-            track_id = len(audio_tracks)
-            tags = stream.get('tags', {})
-            title = tags.get('title', tags.get('handler_name', 'Untitled'))
-            language = tags.get('language', 'unknown')
-            audio_tracks.append({
-                'id': track_id,
-                'title': title,
-                'language': language
-            })
-    return audio_tracks
-
-def get_subtitle_tracks(video_file):
-    """
-    Get list of subtitle tracks and their titles
-    """
-    info = get_track_info(video_file)
-    if not info or 'streams' not in info:
-        return []
+    # Results probed for a different set of fields would be missing data, start over
+    if not isinstance(cache, dict) or cache.get('version') != PROBE_CACHE_VERSION or cache.get('fields') != PROBE_ENTRIES:
+        PROBE_CACHE['dirty'] = True
+        return
     
-    subtitle_tracks = []
-    for stream in info['streams']:
-        if stream.get('codec_type') == 'subtitle':
-            track_id = len(subtitle_tracks)
-            tags = stream.get('tags', {})
-            title = tags.get('title', tags.get('handler_name', 'Untitled'))
-            language = tags.get('language', 'unknown')
-            subtitle_tracks.append({
-                'id': track_id,
-                'title': title,
-                'language': language
-            })
-    return subtitle_tracks
+    # Forget files that are gone so the cache doesn't grow forever
+    entries = cache.get('entries') or {}
+    PROBE_CACHE['entries'] = {path: entry for path, entry in entries.items() if os.path.exists(path)}
+    PROBE_CACHE['dirty'] = len(PROBE_CACHE['entries']) != len(entries)
 
-def is_video_file(file_path):
+def save_probe_cache():
     """
-    Check if the file is a video file using ffprobe
+    Write probe results back to disk if anything new was probed
     """
+    if not PROBE_CACHE['dirty'] or PROBE_CACHE['file'] is None:
+        return
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-select_streams', 'v:0',  # Select first video stream
-            '-show_entries', 'stream=codec_type',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            str(file_path)
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.returncode == 0 and 'video' in result.stdout.lower()
-        
-    except Exception:
-        return False
+        with open(PROBE_CACHE['file'], 'w') as f:
+            json.dump({
+                'version': PROBE_CACHE_VERSION,
+                'fields': PROBE_ENTRIES,
+                'entries': PROBE_CACHE['entries']
+            }, f)
+        PROBE_CACHE['dirty'] = False
+    except OSError as e:
+        print(f"Warning: Could not write {ENCODE_SETTINGS['probe_cache']}: {e}")
+
+def get_track_info(video_file):
+    """
+    Extract track information from video file using ffprobe.
+    Results are reused as long as the file's size and modification time are unchanged
+    """
+    path = Path(video_file)
+    try:
+        stat = path.stat()
+    except OSError as e:
+        print(f"Error processing {video_file}: {str(e)}")
+        return None
+    
+    key = str(path.resolve())
+    entry = PROBE_CACHE['entries'].get(key)
+    if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return entry['info']
+    
+    info = _probe_file(key, stat.st_mtime_ns)
+    if info is not None:
+        PROBE_CACHE['entries'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'info': info}
+        PROBE_CACHE['dirty'] = True
+    return info
+
+def classify_streams(info):
+    """
+    Split the streams of an ffprobe result into video, audio and subtitle track lists
+    in a single pass
+    """
+    tracks = {'video': [], 'audio': [], 'subtitle': []}
+    if not info:
+        return tracks
+    
+    # Bind lookups once, this loop runs for every stream of every file in a batch
+    streams = info.get('streams') or []
+    get_track_list = tracks.get
+    for stream in streams:
+        track_list = get_track_list(stream.get('codec_type'))
+        if track_list is None:
+            continue
+        tags = stream.get('tags') or {}
+        track_list.append({
+            'id': len(track_list),
+            'title': tags.get('title') or tags.get('handler_name') or 'Untitled',
+            'language': tags.get('language') or 'unknown',
+            'codec': stream.get('codec_name')
+        })
+    return tracks
+
+def format_track_list(heading, tracks):
+    """
+    Format a track list for display as a single block of text
+    """
+    lines = [f"\n{heading}:"]
+    lines.extend(f"[{track['id']}]: {track['title']} ({track['language']})" for track in tracks)
+    return '\n'.join(lines) + '\n'
+
+def is_video_file(file_path):
+    """
+    Check if the file is a video file using the cached ffprobe output
+    """
+    return bool(classify_streams(get_track_info(file_path))['video'])
     
 
 def get_encoding_preset(cached_settings=None, file_index=0):
@@ -150,250 +448,508 @@ def get_encoding_preset(cached_settings=None, file_index=0):
     if cached_settings and cached_settings['use_cache'] and 'encoding_preset' in cached_settings:
         return cached_settings['encoding_preset']
     
+    presets = ENCODE_SETTINGS['presets']
+    
     # If we only have the default preset, use it without asking
-    if len(ENCODE_SETTINGS['presets']) == 1:
-        preset = ENCODE_SETTINGS['presets'][0]
+    if len(presets) == 1:
+        preset = presets[0]
         if file_index == 0:
             cached_settings['encoding_preset'] = preset
         return preset
     
-    print("\nAvailable encoding presets:")
-    for i, preset in enumerate(ENCODE_SETTINGS['presets']):
+    # Write the whole menu at once so progress output from running encodes can't split it
+    lines = ["\nAvailable encoding presets:"]
+    for i, preset in enumerate(presets):
         params_str = ', '.join(f"{k}={v}" for k, v in preset.get('params', {}).items())
-        print(f"[{i}] {preset['name']} ({preset['codec']}, {params_str})")
+        lines.append(f"[{i}] {preset['name']} ({preset['codec']}, {params_str})")
+    sys.stdout.write('\n'.join(lines) + '\n')
     
     while True:
         choice = input("\nSelect encoding preset [0]: ").strip() or "0"
         
-        if choice.isdigit() and 0 <= int(choice) < len(ENCODE_SETTINGS['presets']):
-            preset = ENCODE_SETTINGS['presets'][int(choice)]
+        if choice.isdigit() and 0 <= int(choice) < len(presets):
+            preset = presets[int(choice)]
             if file_index == 0:
                 cached_settings['encoding_preset'] = preset
             return preset
         
         print("Invalid choice, please try again")
 
-def encode_video(input_file, cached_settings=None, file_index=0):
+def _faststart_flags():
+    """
+    Muxer flags that put the MP4 index at the front of the file
+    """
+    if ENCODE_SETTINGS['output_extension'].lower() in ('.mp4', '.m4v', '.mov'):
+        return ['-movflags', '+faststart']
+    return []
+
+def build_ffmpeg_cmd(cmd_config, threads=None):
     """
-    Encode video file using ffmpeg with specified settings
+    Build the ffmpeg command line from a command configuration
+    """
+    # Report progress as key=value lines on stdout and never read from our stdin
+    cmd = [FFMPEG, '-hide_banner', '-nostdin', '-nostats', '-progress', 'pipe:1']
+    cmd.extend(cmd_config['input_settings'])
+    cmd.extend(['-i', cmd_config['input']])
+    
+    if cmd_config['filter_complex']:
+        cmd.extend(['-filter_complex', cmd_config['filter_complex']])
+    
+    # 0 lets the encoder use every core
+    if threads is not None:
+        cmd.extend(['-threads', str(threads)])
+    
+    cmd.extend(cmd_config['video_settings'])
+    cmd.extend(cmd_config['audio_settings'])
+    cmd.extend(_faststart_flags())
+    cmd.append(cmd_config['output'])
+    return cmd
+
+def _reindex_args(args, input_index):
+    """
+    Point stream maps that refer to input 0 at another input's streams
+    """
+    args = list(args)
+    for i in range(1, len(args)):
+        if args[i - 1] == '-map' and args[i].startswith('0:'):
+            args[i] = f"{input_index}:{args[i][2:]}"
+    return args
+
+def build_batch_ffmpeg_cmd(cmd_configs):
+    """
+    Build one ffmpeg command line that writes every configuration's output.
+    Only for configurations without a filter graph, their maps all point at input 0
+    """
+    cmd = [FFMPEG, '-hide_banner', '-nostdin', '-nostats', '-progress', 'pipe:1']
+    for cmd_config in cmd_configs:
+        cmd.extend(cmd_config['input_settings'])
+        cmd.extend(['-i', cmd_config['input']])
+    
+    # Output options apply to the next output file, so each file's settings go right before it
+    for i, cmd_config in enumerate(cmd_configs):
+        cmd.extend(_reindex_args(cmd_config['video_settings'] + cmd_config['audio_settings'], i))
+        cmd.extend(_faststart_flags())
+        cmd.append(cmd_config['output'])
+    return cmd
+
+def run_copy_batch(copy_batch, results, threads=None):
+    """
+    Run queued copies in one ffmpeg process and resolve each file's Future.
+    If the shared run fails, every file is retried on its own so one bad file doesn't sink the rest
     """
     try:
-        input_path = Path(input_file)
-        output_path = input_path.parent / f"{input_path.stem}{ENCODE_SETTINGS['output_suffix']}{ENCODE_SETTINGS['output_extension']}"
+        paths = [path for path, _, _ in copy_batch]
+        cmd = build_batch_ffmpeg_cmd([cmd_config for _, cmd_config, _ in copy_batch])
+        # All outputs are written side by side, so the longest file decides the progress
+        durations = [duration for _, _, duration in copy_batch if duration]
+        label = f"{len(paths)} files ({paths[0].name}, ...)"
+        
+        # Only outputs that don't exist yet are ours to clean up if the run fails
+        new_outputs = [Path(cmd_config['output']) for _, cmd_config, _ in copy_batch
+                       if not Path(cmd_config['output']).exists()]
+        
+        if run_ffmpeg(cmd, label, max(durations) if durations else None):
+            for path in paths:
+                results[path].set_result(True)
+            return
         
-        # Initialize command configuration
-        cmd_config = {
-            'input': str(input_path),
-            'output': str(output_path),
-            'video_settings': ['-map', '0:v'],
-            'audio_settings': [],
-            'filter_complex': None
-        }
-        
-        # Get audio tracks and ask for user input
-        audio_tracks = get_audio_tracks(input_path)
-        
-        if audio_tracks:
-            if cached_settings and cached_settings['use_cache']:
-                choice = cached_settings['audio_choice']
-                track_list = cached_settings['audio_tracks']
+        # ffmpeg opens every output before writing any, so a failed run leaves all of them behind
+        for output in new_outputs:
+            output.unlink(missing_ok=True)
+        
+        print(f"Retrying {label} one file at a time...")
+        for path, cmd_config, duration in copy_batch:
+            results[path].set_result(run_ffmpeg(build_ffmpeg_cmd(cmd_config, threads), path, duration))
+    finally:
+        # Never leave main waiting on a file that wasn't resolved
+        for future in results.values():
+            if not future.done():
+                future.set_result(False)
+
+def submit_copy_batch(copy_batch, executor, threads=None):
+    """
+    Start the queued copies and return (path, Future) pairs
+    """
+    if not copy_batch:
+        return []
+    
+    batch = list(copy_batch)
+    copy_batch.clear()
+    
+    if len(batch) == 1:
+        path, cmd_config, duration = batch[0]
+        return [(path, executor.submit(run_ffmpeg, build_ffmpeg_cmd(cmd_config, threads), path, duration))]
+    
+    # One Future per file, resolved by run_copy_batch once its outcome is known
+    results = {path: Future() for path, _, _ in batch}
+    executor.submit(run_copy_batch, batch, results, threads)
+    return list(results.items())
+
+def _drain(pipe, lines):
+    """
+    Read a pipe until it closes, keeping only the most recent lines
+    """
+    for line in pipe:
+        lines.append(line)
+
+def run_ffmpeg(cmd, input_file, duration=None):
+    """
+    Run an ffmpeg command, printing progress as it goes, and report the result
+    """
+    try:
+        # ffmpeg writes UTF-8 (e.g. stream titles) regardless of the console's code page
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, bufsize=1, text=True,
+                                encoding='utf-8', errors='replace')
+        
+        # Drain stderr on its own thread so a chatty ffmpeg can't block on a full pipe
+        stderr_tail = deque(maxlen=ENCODE_SETTINGS['stderr_tail_lines'])
+        stderr_thread = threading.Thread(target=_drain, args=(proc.stderr, stderr_tail), daemon=True)
+        stderr_thread.start()
+        
+        name = Path(input_file).name
+        last_step = 0
+        for line in proc.stdout:
+            key, _, value = line.strip().partition('=')
+            # Despite the name, out_time_ms is in microseconds
+            if key in ('out_time_us', 'out_time_ms') and duration and value.isdigit():
+                step = min(int(int(value) / 1_000_000 / duration * 10), 9)
+                if step > last_step:
+                    last_step = step
+                    print(f"  {name}: {step * 10}%")
+        
+        proc.wait()
+        stderr_thread.join()
+        
+        if proc.returncode != 0:
+            print(f"Error encoding {input_file}: {''.join(stderr_tail)}")
+            return False
+            
+        print(f"Encoding completed successfully: {input_file}")
+        return True
+        
+    except Exception as e:
+        print(f"Error encoding {input_file}: {str(e)}")
+        return False
+
+def can_copy_audio(codec):
+    """
+    Check if an audio stream with this codec can be copied into the output container
+    """
+    extension = ENCODE_SETTINGS['output_extension'].lower()
+    if extension in MATROSKA_EXTENSIONS:
+        return codec is not None
+    return codec in MP4_AUDIO_CODECS and extension in ('.mp4', '.m4v', '.mov')
+
+def is_pure_passthrough(cmd_config):
+    """
+    Check if a command configuration only copies the video and all (or no) audio
+    """
+    return (not cmd_config['filter_complex']
+            and cmd_config['video_settings'] == ['-map', '0:v', '-c:v', 'copy']
+            and cmd_config['audio_settings'] in (['-map', '0:a', '-c:a', 'copy'], ['-an']))
+
+def plan_encoding(cached_settings, tracks, file_index=0):
+    """
+    Work out the ffmpeg settings for a file, asking the user where needed.
+    The plan is independent of the input path so it can be reused across a batch
+    """
+    audio_tracks = tracks['audio']
+    subtitle_tracks = tracks['subtitle']
+    preset = None
+    
+    # Video filters are chained with commas so libavfilter links them directly
+    video_chain = []
+    audio_filter = None
+    
+    # Path-independent parts of the command, the subtitle path is filled in by apply_plan
+    cmd_config = {
+        'video_settings': ['-map', '0:v'],
+        'input_settings': [],
+        'audio_settings': [],
+        'filter_complex': None
+    }
+    
+    # Ask for user input on audio tracks
+    if audio_tracks:
+        if cached_settings and cached_settings['use_cache']:
+            choice = cached_settings['audio_choice']
+            track_list = cached_settings['audio_tracks']
+        else:
+            sys.stdout.write(
+                format_track_list("Available audio tracks", audio_tracks)
+                + "\nHow would you like to handle audio tracks?\n"
+                + "[1] Include specific tracks [default]\n"
+                + "[2] Merge specific tracks\n"
+            )
+            
+            choice = input("\nEnter your choice (1-2): ").strip() or "1"
+            
+            if file_index == 0:  # Store settings for first file
+                cached_settings['audio_choice'] = choice
+            
+            if choice == "1":
+                track_list = input("\nEnter space-separated track IDs to include (empty=all, '-'=none): ").strip()
+            elif choice == "2":
+                track_list = input("\nEnter space-separated track IDs to merge: ").strip()
+            
+            if file_index == 0:  # Store settings for first file
+                cached_settings['audio_tracks'] = track_list
+
+        if choice == "1":
+            if track_list == '':
+                # Include all audio tracks
+                cmd_config['audio_settings'] = ['-map', '0:a', '-c:a', 'copy']
+            elif track_list == '-':
+                # No audio tracks
+                cmd_config['audio_settings'] = ['-an']
             else:
-                print("\nAvailable audio tracks:")
-                for track in audio_tracks:
-                    print(f"[{track['id']}]: {track['title']} ({track['language']})")
+                # Specific tracks
+                track_ids = track_list.split()
+                cmd_config['audio_settings'] = []
+                for track_id in track_ids:
+                    cmd_config['audio_settings'].extend([
+                        '-map', f'0:a:{track_id}',
+                        '-c:a', 'copy'
+                    ])
+        elif choice == "2":
+            if track_list:
+                track_ids = track_list.split()
+                filter_parts = []
+                for i, track_id in enumerate(track_ids):
+                    filter_parts.append(f'[0:a:{track_id}]')
+                filter_parts.append(f"amerge=inputs={len(track_ids)}[aout]")
+                audio_filter = ''.join(filter_parts)
                 
-                print("\nHow would you like to handle audio tracks?")
-                print("[1] Include specific tracks [default]")
-                print("[2] Merge specific tracks")
+                # Original tracks the output container can hold are kept after the merged one, copied
+                copy_tracks = []
+                if ENCODE_SETTINGS['keep_merged_sources']:
+                    copy_tracks = [track for track in audio_tracks if can_copy_audio(track['codec'])]
                 
-                choice = input("\nEnter your choice (1-2): ").strip() or "1"
-                
-                if file_index == 0:  # Store settings for first file
-                    cached_settings['audio_choice'] = choice
-                
-                if choice == "1":
-                    track_list = input("\nEnter space-separated track IDs to include (empty=all, '-'=none): ").strip()
-                elif choice == "2":
-                    track_list = input("\nEnter space-separated track IDs to merge: ").strip()
-                
-                if file_index == 0:  # Store settings for first file
-                    cached_settings['audio_tracks'] = track_list
-
-            if choice == "1":
-                if track_list == '':
-                    # Include all audio tracks
-                    cmd_config['audio_settings'] = ['-map', '0:a', '-c:a', 'copy']
-                elif track_list == '-':
-                    # No audio tracks
-                    cmd_config['audio_settings'] = ['-an']
+                # Set audio mapping and encoding
+                if copy_tracks:
+                    cmd_config['audio_settings'] = ['-map', '[aout]']
+                    for track in copy_tracks:
+                        cmd_config['audio_settings'].extend(['-map', f"0:a:{track['id']}"])
+                    # ffmpeg applies the last matching option, so -c:a:0 has to come after -c:a copy
+                    cmd_config['audio_settings'].extend([
+                        '-c:a', 'copy',
+                        '-c:a:0', ENCODE_SETTINGS['merged_audio_codec']
+                    ])
                 else:
-                    # Specific tracks
-                    track_ids = track_list.split()
-                    cmd_config['audio_settings'] = []
-                    for track_id in track_ids:
-                        cmd_config['audio_settings'].extend([
-                            '-map', f'0:a:{track_id}',
-                            '-c:a', 'copy'
-                        ])
-            elif choice == "2":
-                if track_list:
-                    track_ids = track_list.split()
-                    filter_parts = []
-                    for i, track_id in enumerate(track_ids):
-                        filter_parts.append(f'[0:a:{track_id}]')
-                    filter_parts.append(f"amerge=inputs={len(track_ids)}[aout]")
-                    
-                    # Set the audio filter complex
-                    if cmd_config['filter_complex']:
-                        cmd_config['filter_complex'] = f"{cmd_config['filter_complex']};{''.join(filter_parts)}"
-                    else:
-                        cmd_config['filter_complex'] = ''.join(filter_parts)
-                    
-                    # Set audio mapping and encoding
                     cmd_config['audio_settings'] = [
                         '-map', '[aout]',
                         '-c:a', ENCODE_SETTINGS['merged_audio_codec']
                     ]
-        
+    
+    else:
+        # No audio tracks found
+        cmd_config['audio_settings'] = ['-an']
+    
+    # Handle subtitle tracks
+    selected_subtitle = None
+    should_reencode = False
+    
+    if subtitle_tracks:
+        if cached_settings and cached_settings['use_cache']:
+            sub_choice = str(cached_settings['subtitle_track']) if cached_settings['subtitle_track'] is not None else ""
         else:
-            # No audio tracks found
-            cmd_config['audio_settings'] = ['-an']
-        
-        # Handle subtitle tracks
-        subtitle_tracks = get_subtitle_tracks(input_path)
-        selected_subtitle = None
-        should_reencode = False
-        
-        if subtitle_tracks:
-            if cached_settings and cached_settings['use_cache']:
-                sub_choice = str(cached_settings['subtitle_track']) if cached_settings['subtitle_track'] is not None else ""
-            else:
-                print("\nAvailable subtitle tracks:")
-                for track in subtitle_tracks:
-                    print(f"[{track['id']}]: {track['title']} ({track['language']})")
-                
-                sub_choice = input("\nEnter subtitle track ID to burn into video (empty=none): ").strip()
-                
-                if file_index == 0:  # Store settings for first file
-                    cached_settings['subtitle_track'] = int(sub_choice) if sub_choice.isdigit() else None
-
-            if sub_choice:
-                try:
-                    sub_id = int(sub_choice)
-                    selected_subtitle = next((track for track in subtitle_tracks if track['id'] == sub_id), None)
-                    if selected_subtitle:
-                        should_reencode = True  # Force reencoding if burning subtitles
-                        sub_path = cmd_config['input'].replace('\\', '\\\\').replace(':', '\\:')
-                        if cmd_config['filter_complex']:
-                            current_filter = cmd_config['filter_complex']
-                            subtitle_filter = f"[0:v]subtitles='{sub_path}':si={sub_id}[vout]"
-                            cmd_config['filter_complex'] = f"{current_filter};{subtitle_filter}"
-                            cmd_config['video_settings'] = ['-map', '[vout]'] + cmd_config['video_settings'][2:]
-                        else:
-                            cmd_config['filter_complex'] = f"[0:v]subtitles='{sub_path}':si={sub_id}[vout]"
-                            cmd_config['video_settings'] = ['-map', '[vout]'] + cmd_config['video_settings'][2:]
-                except ValueError:
-                    print("Invalid subtitle track ID, proceeding without subtitles")
-        
-        # Ask about reencoding if no subtitle was selected
-        if not should_reencode:
-            if cached_settings and cached_settings['use_cache']:
-                should_reencode = cached_settings['should_reencode']
-            else:
-                reencode = input("\nDo you want to reencode the video? (y/N): ").strip().lower()
-                should_reencode = reencode == 'y'
-                if file_index == 0:
-                    cached_settings['should_reencode'] = should_reencode
-        
-        # Get encoding preset and resolution if reencoding
-        if should_reencode:
-            # Get encoding preset
-            preset = get_encoding_preset(cached_settings, file_index)
-            
-            # Update video settings with chosen preset
-            cmd_config['video_settings'].extend([
-                '-c:v', preset['codec']
-            ])
+            sys.stdout.write(format_track_list("Available subtitle tracks", subtitle_tracks))
             
-            # Add all parameters from the preset
-            for key, value in preset['params'].items():
-                cmd_config['video_settings'].extend([f'-{key}', str(value)])
-            
-            # Handle resolution
-            if cached_settings and cached_settings['use_cache']:
-                res_choice = str(cached_settings['target_height']) if cached_settings['target_height'] is not None else ""
-            else:
-                res_choice = input("\nEnter target vertical resolution (720, 1080, etc.) or leave empty to keep original: ").strip()
-                if file_index == 0:
-                    cached_settings['target_height'] = int(res_choice) if res_choice.isdigit() else None
+            sub_choice = input("\nEnter subtitle track ID to burn into video (empty=none): ").strip()
             
-            if res_choice and res_choice.isdigit():
-                height = int(res_choice)
-                scale_filter = f"scale=-1:{height}"
-                
-                if cmd_config['filter_complex']:
-                    # Handle both audio merge and scaling
-                    if '[aout]' in cmd_config['filter_complex']:
-                        # We have an audio merge filter, add video scaling in parallel
-                        audio_filter = cmd_config['filter_complex']
-                        video_filter = f"[0:v]{scale_filter}[vout]"
-                        cmd_config['filter_complex'] = f"{audio_filter};{video_filter}"
-                        cmd_config['video_settings'] = ['-map', '[vout]'] + cmd_config['video_settings'][2:]
-                    else:
-                        # We have a subtitle filter, add scaling after it
-                        cmd_config['filter_complex'] = cmd_config['filter_complex'].replace('[vout]', f'[vtmp];[vtmp]{scale_filter}[vout]')
-                else:
-                    # Just scaling
-                    cmd_config['filter_complex'] = f"[0:v]{scale_filter}[vout]"
-                    cmd_config['video_settings'] = ['-map', '[vout]'] + cmd_config['video_settings'][2:]
+            if file_index == 0:  # Store settings for first file
+                cached_settings['subtitle_track'] = int(sub_choice) if sub_choice.isdigit() else None
+
+        if sub_choice:
+            try:
+                sub_id = int(sub_choice)
+                selected_subtitle = next((track for track in subtitle_tracks if track['id'] == sub_id), None)
+                if selected_subtitle:
+                    should_reencode = True  # Force reencoding if burning subtitles
+                    video_chain.append(f"subtitles=filename={{subpath}}:si={sub_id}")
+            except ValueError:
+                print("Invalid subtitle track ID, proceeding without subtitles")
+    
+    # Ask about reencoding if no subtitle was selected
+    if not should_reencode:
+        if cached_settings and cached_settings['use_cache']:
+            should_reencode = cached_settings['should_reencode']
+        else:
+            reencode = input("\nDo you want to reencode the video? (y/N): ").strip().lower()
+            should_reencode = reencode == 'y'
+            if file_index == 0:
+                cached_settings['should_reencode'] = should_reencode
+    
+    # Get encoding preset and resolution if reencoding
+    if should_reencode:
+        # Get encoding preset
+        preset = get_encoding_preset(cached_settings, file_index)
         
-        # If not reencoding, modify settings to copy video stream
-        if not should_reencode:
-            cmd_config['video_settings'] = ['-map', '0:v', '-c:v', 'copy']
+        # Update video settings with chosen preset
+        cmd_config['video_settings'].extend([
+            '-c:v', preset['codec']
+        ])
         
-        # Build final ffmpeg command
-        cmd = ['ffmpeg', '-i', cmd_config['input']]
+        # Add all parameters from the preset
+        for key, value in preset['params'].items():
+            cmd_config['video_settings'].extend([f'-{key}', str(value)])
         
-        if cmd_config['filter_complex']:
-            cmd.extend(['-filter_complex', cmd_config['filter_complex']])
+        # Handle resolution
+        if cached_settings and cached_settings['use_cache']:
+            res_choice = str(cached_settings['target_height']) if cached_settings['target_height'] is not None else ""
+        else:
+            res_choice = input("\nEnter target vertical resolution (720, 1080, etc.) or leave empty to keep original: ").strip()
+            if file_index == 0:
+                cached_settings['target_height'] = int(res_choice) if res_choice.isdigit() else None
         
-        cmd.extend(cmd_config['video_settings'])
-        cmd.extend(cmd_config['audio_settings'])
-        cmd.append(cmd_config['output'])
+        if res_choice and res_choice.isdigit():
+            # Scaling runs after any subtitle burn-in
+            video_chain.append(f"scale=-1:{int(res_choice)}")
+    
+    # If not reencoding, modify settings to copy video stream
+    if not should_reencode:
+        cmd_config['video_settings'] = ['-map', '0:v', '-c:v', 'copy']
+    
+    # Assemble the filter graph from the audio merge and the video chain
+    filters = []
+    if audio_filter:
+        filters.append(audio_filter)
+    if video_chain:
+        filters.append(f"[0:v]{','.join(video_chain)}[vout]")
+        cmd_config['video_settings'] = ['-map', '[vout]'] + cmd_config['video_settings'][2:]
+    cmd_config['filter_complex'] = ';'.join(filters) or None
+    
+    # Nothing is filtered or encoded, so copy everything in one go
+    if is_pure_passthrough(cmd_config):
+        cmd_config['input_settings'] = ['-fflags', '+genpts']
+        maps = ['-map', '0:v'] if cmd_config['audio_settings'] == ['-an'] else ['-map', '0:v', '-map', '0:a']
+        cmd_config['video_settings'] = maps + ['-c', 'copy']
+        cmd_config['audio_settings'] = []
+    
+    # Keep decoded frames on the GPU when nothing needs to touch them in software
+    if should_reencode and preset.get('hwaccel') and not cmd_config['filter_complex']:
+        cmd_config['input_settings'] = ['-hwaccel', preset['hwaccel'], '-hwaccel_output_format', preset['hwaccel']]
+    
+    return EncodingPlan(
+        video_settings=cmd_config['video_settings'],
+        audio_settings=cmd_config['audio_settings'],
+        input_settings=cmd_config['input_settings'],
+        filter_complex_template=cmd_config['filter_complex'],
+        preset=preset if should_reencode else None,
+        subtitle_id=selected_subtitle['id'] if selected_subtitle else None
+    )
+
+def _escape_filter_value(value):
+    """
+    Escape a string for use as a filter option value inside a filtergraph.
+    ffmpeg unescapes twice: once for the filter's option list and once for the graph itself
+    """
+    value = re.sub(r"([\\':])", r"\\\1", value)
+    return re.sub(r"([\\'\[\],;])", r"\\\1", value)
+
+def apply_plan(plan, input_path, output_path):
+    """
+    Fill in the file-specific parts of an encoding plan
+    """
+    filter_complex = plan.filter_complex_template
+    if filter_complex:
+        filter_complex = filter_complex.format(subpath=_escape_filter_value(str(input_path)))
+    
+    return {
+        'input': str(input_path),
+        'output': str(output_path),
+        'input_settings': plan.input_settings,
+        'video_settings': plan.video_settings,
+        'audio_settings': plan.audio_settings,
+        'filter_complex': filter_complex
+    }
+
+def encode_video(input_file, cached_settings=None, file_index=0, executor=None, threads=None, copy_batch=None):
+    """
+    Encode video file using ffmpeg with specified settings.
+    If an executor is given the encode is submitted to it and the Future is returned.
+    In batch mode, files that are only stream-copied are added to copy_batch instead and None is returned
+    """
+    try:
+        input_path = Path(input_file)
+        output_path = input_path.parent / f"{input_path.stem}{ENCODE_SETTINGS['output_suffix']}{ENCODE_SETTINGS['output_extension']}"
+        
+        # Probe once and split streams by type
+        info = get_track_info(input_path) or {}
+        tracks = classify_streams(info)
+        
+        # Files with the same track layout get the same plan, so batches only plan once per layout.
+        # Audio codecs are part of the layout since they decide which tracks can be copied
+        plans = cached_settings.setdefault('_plan', {})
+        layout = (tuple(track['codec'] for track in tracks['audio']), len(tracks['subtitle']))
+        plan = plans.get(layout) if cached_settings['use_cache'] else None
+        if plan is None:
+            plan = plan_encoding(cached_settings, tracks, file_index)
+            if file_index == 0 or cached_settings['use_cache']:
+                plans[layout] = plan
+        
+        cmd_config = apply_plan(plan, input_path, output_path)
+        
+        # Duration comes from the probe and drives the progress display
+        try:
+            duration = float(info.get('format', {}).get('duration'))
+        except (TypeError, ValueError):
+            duration = None
         
         # Print encoding information
         print(f"\nEncoding: {input_path}")
         print(f"Output to: {output_path}")
         print("Settings:")
-        if should_reencode:
-            print(f"  Codec: {preset['codec']}")
-            for key, value in preset['params'].items():
+        if plan.preset:
+            print(f"  Codec: {plan.preset['codec']}")
+            for key, value in plan.preset['params'].items():
                 print(f"  {key}: {value}")
         else:
             print("  Video: Copy (no reencoding)")
-        if selected_subtitle:
+        if plan.subtitle_id is not None:
+            selected_subtitle = tracks['subtitle'][plan.subtitle_id]
             print(f"  Burning subtitle track: [{selected_subtitle['id']}] {selected_subtitle['title']}")
-        print("\nEncoding in progress...")
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # Copies are cheap enough that starting ffmpeg is a big part of the cost, so share one process.
+        # Files whose output already exists would make ffmpeg bail out, and two inputs writing the
+        # same output can't share a process, so those run on their own
+        if (copy_batch is not None and cached_settings['use_cache'] and plan.preset is None
+                and not cmd_config['filter_complex'] and not output_path.exists()
+                and all(queued['output'] != cmd_config['output'] for _, queued, _ in copy_batch)):
+            copy_batch.append((input_path, cmd_config, duration))
+            print("\nQueued for batched copy...")
+            return None
         
-        if result.returncode != 0:
-            print(f"Error encoding {input_file}: {result.stderr}")
-            return False
-            
-        print("Encoding completed successfully!")
-        return True
+        cmd = build_ffmpeg_cmd(cmd_config, threads)
+        
+        if executor is None:
+            print("\nEncoding in progress...")
+            return run_ffmpeg(cmd, input_file, duration)
+        
+        print("\nQueued for encoding...")
+        return executor.submit(run_ffmpeg, cmd, input_file, duration)
         
-    except FileNotFoundError:
-        print("Error: ffmpeg not found. Please ensure ffmpeg is installed and in your PATH")
-        return False
     except Exception as e:
         print(f"Error encoding {input_file}: {str(e)}")
         return False
 
 def main():
+    # Every step below needs ffmpeg, so stop right away if it's missing
+    missing = [name for name, path in (('ffmpeg', FFMPEG), ('ffprobe', FFPROBE)) if path is None]
+    if missing:
+        print(f"Error: {' and '.join(missing)} not found. Please ensure ffmpeg is installed and in your PATH")
+        # Keep the window open so people dropping files onto the script can read the error
+        input("\nPress Enter to exit...")
+        sys.exit(1)
+    
     # Load custom encoding presets if available
     load_encoding_presets()
+    load_hw_encoder_presets()
+    
+    # Reuse probe results from earlier runs and save new ones however we exit
+    load_probe_cache()
+    atexit.register(save_probe_cache)
     
     # Check if files were provided as arguments
     if len(sys.argv) < 2:
@@ -411,36 +967,74 @@ def main():
         'encoding_preset': None
     }
     
-    # Process each file
-    for i, file_path in enumerate(sys.argv[1:]):
-        path = Path(file_path)
+    # Split the available cores between concurrent encodes so they don't oversubscribe.
+    # A single file (or a single encode slot) leaves the thread count to the encoder
+    max_concurrent = max(1, ENCODE_SETTINGS['max_concurrent_encodes'])
+    running_at_once = min(max_concurrent, len(sys.argv[1:]))
+    threads_per_job = 0 if running_at_once == 1 else max(1, (os.cpu_count() or 1) // running_at_once)
+    
+    jobs = []
+    setup_failed = []
+    copy_batch = []
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor, \
+         ThreadPoolExecutor(max_workers=ENCODE_SETTINGS['probe_workers']) as probe_executor:
+        # Probe all files in the background so later files are ready while the user answers prompts
+        probes = {file_path: probe_executor.submit(get_track_info, Path(file_path))
+                  for file_path in sys.argv[1:] if Path(file_path).is_file()}
         
-        if not path.exists():
-            print(f"Error: File not found: {file_path}")
-            continue
+        # Process each file
+        for i, file_path in enumerate(sys.argv[1:]):
+            path = Path(file_path)
             
-        if not path.is_file():
-            print(f"Error: Not a file: {file_path}")
-            continue
-        
-        # Validate if it's a video file
-        if not is_video_file(path):
-            print(f"Error: Not a valid video file: {file_path}")
-            continue
+            if not path.exists():
+                print(f"Error: File not found: {file_path}")
+                continue
+                
+            if not path.is_file():
+                print(f"Error: Not a file: {file_path}")
+                continue
+            
+            # Wait for the background probe, everything after this reads the cached result
+            probes[file_path].result()
+            
+            # Validate if it's a video file
+            if not is_video_file(path):
+                print(f"Error: Not a valid video file: {file_path}")
+                continue
+            
+            # If this is not the first file and we have cached settings, ask if user wants to use them
+            if i == 0:
+                job = encode_video(path, cached_settings, i, executor, threads_per_job)
+                if len(sys.argv[1:]) > 1:  # If there are more files
+                    print("\nMultiple files detected.")
+                    use_same = input("Do you want to use the same settings for all remaining files? (y/N): ").strip().lower()
+                    cached_settings['use_cache'] = use_same == 'y'
+            else:
+                if cached_settings['use_cache']:
+                    print(f"\nProcessing {path} with same settings...")
+                job = encode_video(path, cached_settings, i, executor, threads_per_job, copy_batch)
+            
+            if job:
+                jobs.append((path, job))
+            elif job is False:
+                # Planning or building the command failed, nothing was queued for this file
+                setup_failed.append(path)
+            
+            if len(copy_batch) >= ENCODE_SETTINGS['copy_batch_size']:
+                jobs.extend(submit_copy_batch(copy_batch, executor, threads_per_job))
+            
+            print("\n" + "="*50 + "\n")
         
-        # If this is not the first file and we have cached settings, ask if user wants to use them
-        if i == 0:
-            encode_video(path, cached_settings, i)
-            if len(sys.argv[1:]) > 1:  # If there are more files
-                print("\nMultiple files detected.")
-                use_same = input("Do you want to use the same settings for all remaining files? (y/N): ").strip().lower()
-                cached_settings['use_cache'] = use_same == 'y'
-        else:
-            if cached_settings['use_cache']:
-                print(f"\nProcessing {path} with same settings...")
-            encode_video(path, cached_settings, i)
+        jobs.extend(submit_copy_batch(copy_batch, executor, threads_per_job))
         
-        print("\n" + "="*50 + "\n")
+        if jobs:
+            print("Waiting for encodes to finish...")
+        failed = setup_failed + [path for path, job in jobs if not job.result()]
+    
+    if failed:
+        print(f"\n{len(failed)} of {len(jobs) + len(setup_failed)} encodes failed:")
+        for path in failed:
+            print(f"  {path}")
     
     # Add prompt to prevent auto-closing
     input("\nPress Enter to exit...")